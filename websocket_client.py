@@ -1,16 +1,20 @@
 #!/usr/bin/env python3
 import asyncio
+import csv
 import socketio
-import pandas as pd
 import os
-import signal
-import sys
+import random
 import ssl
 import logging
 from dotenv import load_dotenv
 import aiohttp
 import certifi
 
+try:
+    import uvloop
+except ImportError:  # uvloop does not support Windows
+    uvloop = None
+
 load_dotenv()
 
 log_level = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -20,102 +24,136 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-connected_terminals = []
-terminals_lock = asyncio.Lock()
+_URL_TMPL = "wss://api-terminal-gateway.tillpayments.dev/socket.io/?tid={tid}&mid={mid}&token={token}"
+_MASKED_TMPL = _URL_TMPL.replace("{token}", "***")
+_SSL_CTX = ssl.create_default_context(cafile=certifi.where())
+
+connected_terminals: set[tuple[str, str]] = set()
 
 
 class TerminalSocketIOClient:
-    def __init__(self, mid, tid, token):
+    __slots__ = (
+        "mid",
+        "tid",
+        "log_prefix",
+        "session",
+        "sio",
+        "url",
+        "masked_url",
+        "connected",
+    )
+
+    def __init__(self, mid, tid, token, session):
         self.mid = mid
         self.tid = tid
-        self.token = token
-        ssl_context = ssl.create_default_context(cafile=certifi.where())
-        self.connector = aiohttp.TCPConnector(ssl=ssl_context)
-        self.session = aiohttp.ClientSession(connector=self.connector)
+        self.log_prefix = f"[MID:{mid} TID:{tid}]"
+        self.session = session
         self.sio = socketio.AsyncClient(
             logger=False, engineio_logger=False, http_session=self.session
         )
-        self.url = f"wss://api-terminal-gateway.tillpayments.dev/socket.io/?tid={tid}&mid={mid}&token={token}"
-        self.masked_url = f"wss://api-terminal-gateway.tillpayments.dev/socket.io/?tid={tid}&mid={mid}&token=***"
+        self.url = _URL_TMPL.format(tid=tid, mid=mid, token=token)
+        self.masked_url = _MASKED_TMPL.format(tid=tid, mid=mid)
         self.connected = False
         self._register_handlers()
 
     def _register_handlers(self):
-        @self.sio.event
-        async def connect():
-            logger.info(f"[MID:{self.mid} TID:{self.tid}] Connected to server")
-            self.connected = True
-            async with terminals_lock:
-                if [self.mid, self.tid] not in connected_terminals:
-                    connected_terminals.append([self.mid, self.tid])
-                logger.info(
-                    f"Connected terminals: {connected_terminals} (Total: {len(connected_terminals)})"
-                )
+        self.sio.on("connect", self._on_connect)
+        self.sio.on("disconnect", self._on_disconnect)
+        self.sio.on("*", self._on_any_event)
+        self.sio.on("message", self._on_message)
+        self.sio.on("ping", self._on_ping)
+        self.sio.on("pong", self._on_pong)
+
+    # %-style arguments let logging skip formatting when INFO is disabled.
+    async def _on_connect(self):
+        logger.info("%s Connected to server", self.log_prefix)
+        self.connected = True
+        connected_terminals.add((self.mid, self.tid))
+        logger.info(
+            "Connected terminals: %s (Total: %d)",
+            connected_terminals,
+            len(connected_terminals),
+        )
 
-        @self.sio.event
-        async def disconnect():
-            logger.info(f"[MID:{self.mid} TID:{self.tid}] Disconnected from server")
-            self.connected = False
-            async with terminals_lock:
-                if [self.mid, self.tid] in connected_terminals:
-                    connected_terminals.remove([self.mid, self.tid])
-                logger.info(
-                    f"Connected terminals: {connected_terminals} (Total: {len(connected_terminals)})"
-                )
+    async def _on_disconnect(self):
+        logger.info("%s Disconnected from server", self.log_prefix)
+        self.connected = False
+        connected_terminals.discard((self.mid, self.tid))
+        logger.info(
+            "Connected terminals: %s (Total: %d)",
+            connected_terminals,
+            len(connected_terminals),
+        )
 
-        @self.sio.on("*")
-        async def catch_all(event, data):
-            logger.info(f"[MID:{self.mid} TID:{self.tid}] Event: {event}, Data: {data}")
+    async def _on_any_event(self, event, data):
+        logger.info("%s Event: %s, Data: %s", self.log_prefix, event, data)
 
-        @self.sio.on("message")
-        async def on_message(data):
-            logger.info(f"[MID:{self.mid} TID:{self.tid}] Message: {data}")
+    async def _on_message(self, data):
+        logger.info("%s Message: %s", self.log_prefix, data)
 
-        @self.sio.event
-        async def ping():
-            async with terminals_lock:
-                logger.info(
-                    f"[MID:{self.mid} TID:{self.tid}] PING received - Connected terminals: {connected_terminals} (Total: {len(connected_terminals)})"
-                )
+    async def _on_ping(self):
+        logger.info(
+            "%s PING received - Connected terminals: %s (Total: %d)",
+            self.log_prefix,
+            connected_terminals,
+            len(connected_terminals),
+        )
 
-        @self.sio.event
-        async def pong():
-            async with terminals_lock:
-                logger.info(
-                    f"[MID:{self.mid} TID:{self.tid}] PONG sent - Connected terminals: {connected_terminals} (Total: {len(connected_terminals)})"
-                )
+    async def _on_pong(self):
+        logger.info(
+            "%s PONG sent - Connected terminals: %s (Total: %d)",
+            self.log_prefix,
+            connected_terminals,
+            len(connected_terminals),
+        )
 
     async def connect(self):
-        try:
-            for attempt in range(3):
-                try:
-                    logger.info(
-                        f"[MID:{self.mid} TID:{self.tid}] Connecting to {self.masked_url} (attempt {attempt+1})..."
-                    )
-                    await self.sio.connect(self.url, transports=["websocket"])
-                    await self.sio.wait()
-                    break
-                except Exception as e:
-                    logger.error(f"[MID:{self.mid} TID:{self.tid}] Connection error: {e}")
-                    await asyncio.sleep(5)
-        finally:
-            await self.session.close()
-
-
-async def run_client(mid, tid, token):
-    client = TerminalSocketIOClient(mid, tid, token)
-    while True:
-        try:
-            await client.connect()
-            logger.info(f"[MID:{mid} TID:{tid}] Reconnecting in 5 seconds...")
-            await asyncio.sleep(5)
-        except asyncio.CancelledError:
-            logger.info(f"[MID:{mid} TID:{tid}] Shutdown requested")
-            break
-        except Exception as e:
-            logger.error(f"[MID:{mid} TID:{tid}] Error: {e}")
-            logger.info(f"[MID:{mid} TID:{tid}] Retrying in 5 seconds...")
-            await asyncio.sleep(5)
+        """Try up to three times to connect; return True once a session has run."""
+        for attempt in range(3):
+            try:
+                logger.info(
+                    f"{self.log_prefix} Connecting to {self.masked_url} (attempt {attempt+1})..."
+                )
+                await self.sio.connect(self.url, transports=["websocket"])
+                await self.sio.wait()
+                return True
+            except Exception as e:
+                logger.error(f"{self.log_prefix} Connection error: {e}")
+                # After the last attempt run_client applies its own backoff.
+                if attempt < 2:
+                    await asyncio.sleep(2**attempt + random.random())
+        return False
+
+    async def aclose(self):
+        """Disconnect the socket; the shared HTTP session is closed by main()."""
+        await self.sio.disconnect()
+
+
+async def run_client(mid, tid, token, session, start_delay=0.0):
+    await asyncio.sleep(start_delay)
+    client = TerminalSocketIOClient(mid, tid, token, session)
+    # Exponential backoff with jitter so terminals don't reconnect in lockstep.
+    backoff = 1.0
+    try:
+        while True:
+            try:
+                if await client.connect():
+                    backoff = 1.0
+                delay = backoff + random.random()
+                logger.info(f"{client.log_prefix} Reconnecting in {delay:.1f} seconds...")
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, 60.0)
+            except asyncio.CancelledError:
+                logger.info(f"{client.log_prefix} Shutdown requested")
+                break
+            except Exception as e:
+                delay = backoff + random.random()
+                logger.error(f"{client.log_prefix} Error: {e}")
+                logger.info(f"{client.log_prefix} Retrying in {delay:.1f} seconds...")
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, 60.0)
+    finally:
+        await client.aclose()
 
 
 async def periodic_status():
@@ -123,13 +161,12 @@ async def periodic_status():
     try:
         while True:
             await asyncio.sleep(25)  # Every 25 seconds to align with server ping interval
-            async with terminals_lock:
-                if connected_terminals:
-                    logger.info(
-                        f"STATUS: {len(connected_terminals)} terminals connected: {connected_terminals}"
-                    )
-                else:
-                    logger.info("STATUS: No terminals connected")
+            if connected_terminals:
+                # The full set is only formatted at DEBUG; INFO logs the count.
+                logger.info("STATUS: %d terminals connected", len(connected_terminals))
+                logger.debug("STATUS details: %s", connected_terminals)
+            else:
+                logger.info("STATUS: No terminals connected")
     except asyncio.CancelledError:
         logger.info("Status monitoring stopped")
 
@@ -140,8 +177,9 @@ async def main():
         logger.error("Error: TOKEN not found in .env file")
         return
     try:
-        df = pd.read_csv("terminals.csv")
-        terminals = df[["mid", "tid"]].to_dict("records")
+        # utf-8-sig strips the BOM that Excel adds to saved CSVs.
+        with open("terminals.csv", newline="", encoding="utf-8-sig") as f:
+            terminals = [{"mid": r["mid"], "tid": r["tid"]} for r in csv.DictReader(f)]
     except Exception as e:
         logger.error(f"Error reading terminals.csv: {e}")
         return
@@ -150,34 +188,26 @@ async def main():
         return
     logger.info(f"Starting Socket.IO clients for {len(terminals)} terminals...")
 
-    status_task = asyncio.create_task(periodic_status())
-    tasks = []
-    
-    for terminal in terminals:
-        task = asyncio.create_task(run_client(terminal["mid"], terminal["tid"], token))
-        tasks.append(task)
-    
-    all_tasks = [status_task] + tasks
-    
-    try:
-        await asyncio.gather(*all_tasks)
-    except (KeyboardInterrupt, asyncio.CancelledError):
-        logger.info("\nShutting down gracefully...")
-        
-        # Cancel all tasks
-        for task in all_tasks:
-            task.cancel()
-        
-        # Wait for tasks to complete cancellation with proper exception handling
-        results = await asyncio.gather(*all_tasks, return_exceptions=True)
-        
-        # Log any unexpected exceptions (not CancelledError)
-        for i, result in enumerate(results):
-            if isinstance(result, Exception) and not isinstance(result, asyncio.CancelledError):
-                logger.error(f"Task {i} failed during shutdown: {result}")
-        
-        logger.info("All clients disconnected successfully")
+    # One session (and connection pool) shared by every terminal; limit=0 because
+    # each websocket holds its connection open for the lifetime of the client.
+    connector = aiohttp.TCPConnector(ssl=_SSL_CTX, limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        try:
+            # On Ctrl+C asyncio.Runner cancels main(), and the TaskGroup cancels
+            # every child and waits for it; a second Ctrl+C force-quits.
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(periodic_status())
+                # Stagger startup so the TLS handshakes don't all land in the same tick.
+                for i, terminal in enumerate(terminals):
+                    start_delay = i * 0.01 + random.random() * 0.5
+                    tg.create_task(
+                        run_client(terminal["mid"], terminal["tid"], token, session, start_delay)
+                    )
+        except asyncio.CancelledError:
+            logger.info("All clients disconnected successfully")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    loop_factory = uvloop.new_event_loop if uvloop else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(main())